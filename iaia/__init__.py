@@ -14,13 +14,34 @@ magic = sys.modules[__name__ + ".magic"] = MagicModule()
 
 def set_verbose(verbose=True):
     """Set verbose mode for all clients."""
-    from .gptclient import gpt_client
+    from .gptclient import shared_clients
 
-    gpt_client.verbose = verbose
+    for client in shared_clients():
+        client.verbose = verbose
 
 
 def set_gpt_key(key):
-    """Set the GPT-3 API key for all clients."""
+    """Set the GPT-3 API key for the default client (containers created
+    with their own `gpt_key` keep using that key)."""
     from .gptclient import gpt_client
 
     gpt_client.key = key
+
+
+def set_cache_server(address, secret=None):
+    """Share the response cache through a cache server ("host:port").
+
+    Start a server with `python -m iaia.cacheserver`. `secret` is the key
+    entries are signed with (default: `IAIA_CACHE_SECRET`). Pass None as the
+    address to go back to the local `iaia-cache/` directory.
+    """
+    from pathlib import Path
+    from .cache import DirectoryCache, ServerCache
+    from .gptclient import shared_clients
+
+    if address is None:
+        cache = DirectoryCache(Path.cwd() / "iaia-cache")
+    else:
+        cache = ServerCache(address, secret=secret)
+    for client in shared_clients():
+        client.cache = cache
@@ -0,0 +1,230 @@
+"""Cache backends for GPT responses.
+
+Backends store opaque bytes by key; `GptClient` does the pickling.
+"""
+from pathlib import Path
+import hashlib
+import hmac
+import os
+import socket
+import threading
+from .fileutil import atomic_write
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+
+class CacheError(Exception):
+    pass
+
+
+class DirectoryCache:
+    """Stores each entry as a file in a local directory.
+
+    Writes go to a temporary file that is renamed into place, so readers
+    never see a half-written file. Writers (including other processes) are
+    serialized with a lock file in the directory when `fcntl` is available.
+    """
+
+    def __init__(self, cache_dir, suffix=".pickle"):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.suffix = suffix
+
+    def filename(self, key):
+        return self.cache_dir / f"{key}{self.suffix}"
+
+    def get(self, key):
+        try:
+            return self.filename(key).read_bytes()
+        except FileNotFoundError:
+            return None
+
+    def set(self, key, data):
+        filename = self.filename(key)
+        with self._lock():
+            with atomic_write(filename, suffix=self.suffix) as fp:
+                fp.write(data)
+
+    def _lock(self):
+        if fcntl is None:
+            return _NullLock()
+        return _FileLock(self.cache_dir / ".lock")
+
+    def __repr__(self):
+        return f"<DirectoryCache {self.cache_dir}>"
+
+
+class _FileLock:
+    def __init__(self, filename):
+        self.filename = filename
+        self.fp = None
+
+    def __enter__(self):
+        self.fp = open(self.filename, "ab")
+        fcntl.flock(self.fp.fileno(), fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc_info):
+        try:
+            fcntl.flock(self.fp.fileno(), fcntl.LOCK_UN)
+        finally:
+            self.fp.close()
+            self.fp = None
+
+
+class _NullLock:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+def parse_address(address):
+    """Turn "host:port" (or a (host, port) tuple) into a (host, port) tuple."""
+    if isinstance(address, str):
+        host, _, port = address.rpartition(":")
+        return (host or "localhost", int(port))
+    host, port = address
+    return (host, int(port))
+
+
+class ServerCache:
+    """Talks to a cache server (see `iaia.cacheserver`) over TCP.
+
+    The protocol is line-based:
+
+        GET <key>\\n            -> <length>\\n<data>  (length -1 on a miss)
+        SET <key> <length>\\n<data> -> OK\\n
+
+    Connections are kept in a small pool and reused between requests.
+
+    Entries get unpickled, so each one is signed with an HMAC of the key and
+    data using `secret` (shared by every client of the server), and entries
+    with a bad signature are rejected before anything reads them. The
+    secret defaults to the `IAIA_CACHE_SECRET` environment variable.
+    """
+
+    def __init__(self, address, secret=None, pool_size=4, timeout=10):
+        if secret is None:
+            secret = os.environ.get("IAIA_CACHE_SECRET")
+        if not secret:
+            raise CacheError(
+                "A shared secret is required to use a cache server "
+                "(set IAIA_CACHE_SECRET)"
+            )
+        if isinstance(secret, str):
+            secret = secret.encode("utf8")
+        self.secret = secret
+        self.address = parse_address(address)
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self._pool = []
+        self._pool_lock = threading.Lock()
+
+    def get(self, key):
+        def request(fp):
+            fp.write(f"GET {key}\n".encode("utf8"))
+            fp.flush()
+            length = int(self._read_line(fp))
+            if length < 0:
+                return None
+            return self._read_exactly(fp, length)
+
+        signed = self._request(request)
+        if signed is None:
+            return None
+        signature, data = signed[: self._digest_size], signed[self._digest_size :]
+        if len(signature) != self._digest_size or not hmac.compare_digest(
+            signature, self._sign(key, data)
+        ):
+            raise CacheError(f"Cache entry {key} has a bad signature")
+        return data
+
+    def set(self, key, data):
+        data = self._sign(key, data) + data
+
+        def request(fp):
+            fp.write(f"SET {key} {len(data)}\n".encode("utf8"))
+            fp.write(data)
+            fp.flush()
+            line = self._read_line(fp)
+            if line != "OK":
+                raise CacheError(f"Unexpected response from cache server: {line!r}")
+
+        self._request(request)
+
+    _digest_size = hashlib.sha256().digest_size
+
+    def _sign(self, key, data):
+        message = key.encode("utf8") + b"\n" + data
+        return hmac.new(self.secret, message, hashlib.sha256).digest()
+
+    def _request(self, func):
+        conn, reused = self._acquire()
+        try:
+            result = func(conn[1])
+        except (OSError, ValueError, CacheError):
+            self._close(conn)
+            if not reused:
+                raise
+            # A pooled connection may have gone stale (e.g., the server
+            # restarted), so retry once on a fresh one:
+            conn = self._connect()
+            try:
+                result = func(conn[1])
+            except (OSError, ValueError, CacheError):
+                self._close(conn)
+                raise
+        self._release(conn)
+        return result
+
+    def _acquire(self):
+        with self._pool_lock:
+            if self._pool:
+                return self._pool.pop(), True
+        return self._connect(), False
+
+    def _connect(self):
+        sock = socket.create_connection(self.address, timeout=self.timeout)
+        return (sock, sock.makefile("rwb"))
+
+    def _release(self, conn):
+        with self._pool_lock:
+            if len(self._pool) < self.pool_size:
+                self._pool.append(conn)
+                return
+        self._close(conn)
+
+    def _close(self, conn):
+        sock, fp = conn
+        try:
+            fp.close()
+        finally:
+            sock.close()
+
+    def close(self):
+        with self._pool_lock:
+            pool, self._pool = self._pool, []
+        for conn in pool:
+            self._close(conn)
+
+    @staticmethod
+    def _read_line(fp):
+        line = fp.readline()
+        if not line:
+            raise CacheError("Cache server closed the connection")
+        return line.decode("utf8").strip()
+
+    @staticmethod
+    def _read_exactly(fp, length):
+        data = fp.read(length)
+        if len(data) != length:
+            raise CacheError("Cache server closed the connection")
+        return data
+
+    def __repr__(self):
+        return f"<ServerCache {self.address[0]}:{self.address[1]}>"
@@ -0,0 +1,115 @@
+"""A small cache server that many `GptClient` processes can share.
+
+Run it with:
+
+    python -m iaia.cacheserver --host 0.0.0.0 --port 8765 --cache-dir iaia-server-cache
+
+It only listens on 127.0.0.1 unless given `--host`. Point clients at it with
+`IAIA_CACHE_SERVER=host:8765` or `iaia.set_cache_server("host:8765")`, and give
+every client the same `IAIA_CACHE_SECRET`. The server just stores bytes;
+clients sign entries and check the signatures (see `iaia.cache.ServerCache`
+for that and the protocol), so the server never needs the secret.
+"""
+import argparse
+import re
+import socketserver
+import threading
+from .cache import DirectoryCache
+
+_key_re = re.compile(r"^[a-zA-Z0-9_\-]+$")
+_length_re = re.compile(r"^[0-9]+$")
+max_entry_size = 64 * 1024 * 1024
+
+
+class MemoryCache:
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            return self._data.get(key)
+
+    def set(self, key, data):
+        with self._lock:
+            self._data[key] = data
+
+
+class CacheRequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            parts = line.decode("utf8", "replace").split()
+            if not parts:
+                continue
+            command, args = parts[0].upper(), parts[1:]
+            if command == "GET" and len(args) == 1 and _key_re.match(args[0]):
+                data = self.server.cache.get(args[0])
+                if data is None:
+                    self.wfile.write(b"-1\n")
+                else:
+                    self.wfile.write(f"{len(data)}\n".encode("utf8") + data)
+            elif (
+                command == "SET"
+                and len(args) == 2
+                and _key_re.match(args[0])
+                and _length_re.match(args[1])
+                and int(args[1]) <= max_entry_size
+            ):
+                length = int(args[1])
+                data = self.rfile.read(length)
+                if len(data) != length:
+                    return
+                self.server.cache.set(args[0], data)
+                self.wfile.write(b"OK\n")
+            else:
+                self.wfile.write(b"ERROR bad request\n")
+                return
+            self.wfile.flush()
+
+
+class CacheServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, cache_dir=None):
+        if cache_dir:
+            # Entries here are signed blobs, not the plain pickles GptClient
+            # keeps locally, so they get their own suffix in case the
+            # directory is shared with a local cache:
+            self.cache = DirectoryCache(cache_dir, suffix=".signed")
+        else:
+            self.cache = MemoryCache()
+        super().__init__(address, CacheRequestHandler)
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m iaia.cacheserver",
+        description="Serve a shared iaia response cache",
+    )
+    parser.add_argument(
+        "--host",
+        default="127.0.0.1",
+        help="Address to listen on (default only accepts local connections)",
+    )
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument(
+        "--cache-dir",
+        help="Directory to persist entries in (otherwise they are kept in memory)",
+    )
+    options = parser.parse_args(args)
+    server = CacheServer((options.host, options.port), cache_dir=options.cache_dir)
+    print(f"Serving iaia cache on {options.host}:{options.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
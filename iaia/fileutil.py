@@ -0,0 +1,33 @@
+from contextlib import contextmanager
+from pathlib import Path
+import os
+import tempfile
+
+# There's no way to read the umask without setting it, so do it once:
+_umask = os.umask(0)
+os.umask(_umask)
+
+
+@contextmanager
+def atomic_write(filename, suffix=""):
+    """Open a temporary file to write, then rename it to `filename`.
+
+    Readers see either the old file or the complete new one, never a partial
+    write, and if writing fails the old file is left alone. The new file gets
+    the usual permissions for the umask (mkstemp would make it private).
+    """
+    filename = Path(filename)
+    fd, tmp_name = tempfile.mkstemp(
+        dir=filename.parent, prefix=".tmp-", suffix=suffix
+    )
+    try:
+        with os.fdopen(fd, "wb") as fp:
+            yield fp
+        os.chmod(tmp_name, 0o666 & ~_umask)
+        os.replace(tmp_name, filename)
+    except BaseException:
+        try:
+            os.unlink(tmp_name)
+        except FileNotFoundError:
+            pass
+        raise
@@ -5,7 +5,10 @@ import hashlib
 import re
 import time
 import os
+import random
+import warnings
 from collections import namedtuple
+from .cache import CacheError, DirectoryCache, ServerCache
 
 
 class GptClientError(Exception):
@@ -13,16 +16,31 @@ class GptClientError(Exception):
 
 
 class GptRateLimitError(GptClientError):
-    pass
+    def __init__(self, message, retry_at=None):
+        super().__init__(message)
+        # When (time.time()) the limit will allow another request, if known:
+        self.retry_at = retry_at
 
 
 GptRequest = namedtuple("GptRequest", "prompt engine max_tokens temperature stop")
 
 
 class GptClient:
-    def __init__(self):
-        self.cache_dir = Path.cwd() / "iaia-cache"
-        self.cache_dir.mkdir(exist_ok=True)
+    def __init__(self, cache=None, key=None):
+        if cache is None:
+            server = os.environ.get("IAIA_CACHE_SERVER")
+            if server:
+                try:
+                    cache = ServerCache(server)
+                except CacheError as e:
+                    warnings.warn(
+                        f"Not using cache server {server}: {e}; "
+                        "using the local iaia-cache/ directory instead"
+                    )
+            if cache is None:
+                cache = DirectoryCache(Path.cwd() / "iaia-cache")
+        self.cache = cache
+        self.key = key
         self.rate_limit = 15  # requests per minute
         self._last_times = []
         self.default_engine = "text-davinci-003"
@@ -56,20 +74,27 @@ class GptClient:
             return val["response"]
         self._last_times = [t for t in self._last_times if t > time.time() - 60]
         if len(self._last_times) >= self.rate_limit:
+            # A slot opens when enough old requests leave the 60s window:
+            oldest = self._last_times[len(self._last_times) - self.rate_limit]
             raise GptRateLimitError(
-                f"Rate limit of {self.rate_limit} requests per second exceeded"
+                f"Rate limit of {self.rate_limit} requests per second exceeded",
+                retry_at=oldest + 60,
             )
         self._last_times.append(time.time())
 
         start = time.time()
         if self.verbose:
             self.print_request(request, cached=False)
+        extra = {}
+        if self.key:
+            extra["api_key"] = self.key
         response = openai.Completion.create(
             engine=engine,
             prompt=prompt,
             max_tokens=max_tokens,
             temperature=temperature,
             stop=stop,
+            **extra,
         )
         self._tokens += response["usage"]["total_tokens"]
         response_time = time.time() - start
@@ -89,28 +114,41 @@ class GptClient:
             self.print_response(response, response_time=response_time)
         return response
 
+    # The cache is best-effort: if it's unavailable we carry on without it.
+
     def get_cache(self, request):
-        filename = self.get_cache_filename(request)
-        if filename.exists():
-            text = filename.read_bytes()
-            data = pickle.loads(text)
-            return data
-        return None
+        try:
+            text = self.cache.get(self.get_cache_key(request))
+        except (OSError, CacheError) as e:
+            if self.verbose:
+                print(f"Cache read failed ({self.cache!r}): {e}")
+            return None
+        if text is None:
+            return None
+        try:
+            return pickle.loads(text)
+        except Exception as e:
+            # Truncated, corrupt, or written by something else:
+            if self.verbose:
+                print(f"Cache entry unreadable ({self.cache!r}): {e!r}")
+            return None
 
     def set_cache(self, request, data):
-        filename = self.get_cache_filename(request)
         text = pickle.dumps(data)
-        filename.write_bytes(text)
+        try:
+            self.cache.set(self.get_cache_key(request), text)
+        except (OSError, CacheError) as e:
+            if self.verbose:
+                print(f"Cache write failed ({self.cache!r}): {e}")
 
     title_illegal_re = re.compile(r"[^a-zA-Z0-9_\-]")
 
-    def get_cache_filename(self, request):
+    def get_cache_key(self, request):
         title = request[0][:15]
         title = self.title_illegal_re.sub("_", title)
         serialized = pickle.dumps(str(request))
         h = hashlib.sha1(serialized).hexdigest()
-        filename = f"{title}-{h}.pickle"
-        return self.cache_dir / f"{filename}"
+        return f"{title}-{h}"
 
     def print_request(self, request, cached=False):
         # print("=" * 60)
@@ -151,4 +189,125 @@ class GptClient:
             return f"${p:.2f}"
 
 
+# Errors that are about the route (key, engine, or connection) rather than
+# the request, so another route might succeed:
+failover_errors = (
+    GptRateLimitError,
+    openai.error.RateLimitError,
+    openai.error.APIError,
+    openai.error.Timeout,
+    openai.error.APIConnectionError,
+    openai.error.ServiceUnavailableError,
+    openai.error.AuthenticationError,
+)
+
+
+class RoutingGptClient:
+    """Spreads requests over several clients (e.g., one per API key).
+
+    Each request goes to a route picked at random by weight. If that route
+    fails with one of `failover_errors` (rate limits, outages, a bad key) it
+    is skipped for `cooldown` seconds (or, for the client's own rate limit,
+    until that limit allows another request) and the request is tried on the
+    next route. Other errors, like an invalid request, are raised right away.
+    """
+
+    def __init__(self, routes=(), cooldown=20):
+        self.routes = []
+        self.cooldown = cooldown
+        self._random = random.Random()
+        for route in routes:
+            if isinstance(route, (tuple, list)):
+                self.add_route(*route)
+            else:
+                self.add_route(route)
+
+    def add_route(self, client, weight=1, engine=None):
+        """Add a route; `client` can be a GptClient or an API key. If
+        `engine` is given, requests on this route always use that engine."""
+        if isinstance(client, str):
+            client = get_client(key=client)
+        self.routes.append(GptRoute(client, weight, engine))
+
+    @property
+    def verbose(self):
+        return any(route.client.verbose for route in self.routes)
+
+    @verbose.setter
+    def verbose(self, value):
+        for route in self.routes:
+            route.client.verbose = value
+
+    def create_completion(self, prompt, engine=None, **kw):
+        if not any(route.weight > 0 for route in self.routes):
+            raise GptClientError("No routes configured")
+        error = None
+        for route in self._ordered_routes():
+            try:
+                response = route.client.create_completion(
+                    prompt, engine=route.engine or engine, **kw
+                )
+            except failover_errors as e:
+                route.failed_until = time.time() + self.cooldown
+                if isinstance(e, GptRateLimitError) and e.retry_at:
+                    route.failed_until = e.retry_at
+                route.failures += 1
+                error = e
+                continue
+            route.failed_until = 0
+            return response
+        raise error
+
+    def _ordered_routes(self):
+        """Routes that are up in weighted random order, then the ones that
+        recently failed (soonest to recover first). Routes with a weight of 0
+        are never used."""
+        now = time.time()
+        routes = [r for r in self.routes if r.weight > 0]
+        up = [r for r in routes if r.failed_until <= now]
+        down = [r for r in routes if r.failed_until > now]
+        ordered = []
+        while up:
+            route = self._random.choices(up, weights=[r.weight for r in up])[0]
+            up.remove(route)
+            ordered.append(route)
+        ordered.extend(sorted(down, key=lambda r: r.failed_until))
+        return ordered
+
+
+class GptRoute:
+    def __init__(self, client, weight=1, engine=None):
+        self.client = client
+        self.weight = weight
+        self.engine = engine
+        self.failed_until = 0
+        self.failures = 0
+
+    def __repr__(self):
+        return f"<GptRoute {self.client!r} weight={self.weight} engine={self.engine}>"
+
+
 gpt_client = GptClient()
+
+# One client per API key, so the key's rate limit is shared by everything
+# using it:
+_key_clients = {}
+
+
+def get_client(client=None, key=None):
+    """The client a container should use: `client` if given, the shared
+    client for `key` if given, otherwise the default client."""
+    if client is not None:
+        return client
+    if key:
+        if key not in _key_clients:
+            _key_clients[key] = GptClient(cache=gpt_client.cache, key=key)
+            _key_clients[key].verbose = gpt_client.verbose
+        return _key_clients[key]
+    return gpt_client
+
+
+def shared_clients():
+    """The default client and every per-key client from `get_client()`;
+    the `iaia.set_*()` functions apply to all of these."""
+    return [gpt_client, *_key_clients.values()]
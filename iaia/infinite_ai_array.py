@@ -3,7 +3,8 @@ from collections.abc import MutableSequence, MutableMapping
 import re
 from .inspectcontext import get_frame_source
 from .coercion import is_num, as_num
-from .gptclient import gpt_client
+from .gptclient import get_client
+from .snapshot import save_state, load_state
 
 
 class InfiniteAIArray(MutableSequence):
@@ -12,12 +13,14 @@ class InfiniteAIArray(MutableSequence):
         _iterable=None,
         *,
         gpt_key=None,
+        gpt_client=None,
         gpt_engine="text-davinci-003",
         uplevel=0,
     ):
         self._list = list(_iterable or [])
         self._waiting_items = []
         self.gpt_key = gpt_key
+        self.gpt_client = get_client(gpt_client, gpt_key)
         self.gpt_engine = gpt_engine
         self.max_gpt_context = 10
         self._max_easy_grow = 10
@@ -86,6 +89,39 @@ class InfiniteAIArray(MutableSequence):
     def __len__(self):
         return len(self._list)
 
+    _snapshot_attrs = (
+        "gpt_engine",
+        "max_gpt_context",
+        "_max_easy_grow",
+        "_max_tries",
+        "_prompt_context",
+        "_type",
+    )
+
+    def save(self, path):
+        """Save the items (including ones generated but not yet used) and
+        settings to `path`. The API key is not saved. Loading the file
+        unpickles parts of it, so only share snapshots with jobs you trust."""
+        save_state(
+            path,
+            self.__class__.__name__,
+            {name: getattr(self, name) for name in self._snapshot_attrs},
+            {"items": self._list, "waiting_items": self._waiting_items},
+        )
+
+    @classmethod
+    def load(cls, path, *, gpt_key=None, gpt_client=None):
+        """Create an array from a file written by `save()`. Only load files
+        from a trusted source: parts of the file are unpickled."""
+        attrs, columns = load_state(path, cls.__name__)
+        self = cls.__new__(cls)
+        self.gpt_key = gpt_key
+        self.gpt_client = get_client(gpt_client, gpt_key)
+        self.__dict__.update(attrs)
+        self._list = columns["items"]
+        self._waiting_items = columns["waiting_items"]
+        return self
+
     def _get_next_item(self, upto):
         tries = self._max_tries
         while True:
@@ -110,7 +146,7 @@ class InfiniteAIArray(MutableSequence):
 {nums}
 {last_num + 2}.
     """.strip()
-            response = gpt_client.create_completion(
+            response = self.gpt_client.create_completion(
                 engine=self.gpt_engine,
                 prompt=prompt,
                 temperature=0.5,
@@ -176,11 +212,15 @@ class InfiniteAIDict(MutableMapping):
         self,
         _iterable=None,
         *,
+        gpt_key=None,
+        gpt_client=None,
         gpt_engine="text-davinci-003",
         uplevel=0,
         ratelimit=5,
     ):
         self._dict = dict(_iterable or ())
+        self.gpt_key = gpt_key
+        self.gpt_client = get_client(gpt_client, gpt_key)
         self.gpt_engine = gpt_engine
         self.rate_limit = ratelimit
         # Really we don't need as much context as in a list because these are unordered and a few examples should do:
@@ -227,6 +267,37 @@ class InfiniteAIDict(MutableMapping):
     def __len__(self):
         return len(self._dict)
 
+    _snapshot_attrs = (
+        "gpt_engine",
+        "rate_limit",
+        "max_gpt_context",
+        "_prompt_context",
+        "_type",
+    )
+
+    def save(self, path):
+        """Save the items and settings to `path`. The API key is not saved.
+        Loading the file unpickles parts of it, so only share snapshots with
+        jobs you trust."""
+        save_state(
+            path,
+            self.__class__.__name__,
+            {name: getattr(self, name) for name in self._snapshot_attrs},
+            {"keys": list(self._dict.keys()), "values": list(self._dict.values())},
+        )
+
+    @classmethod
+    def load(cls, path, *, gpt_key=None, gpt_client=None):
+        """Create a dict from a file written by `save()`. Only load files
+        from a trusted source: parts of the file are unpickled."""
+        attrs, columns = load_state(path, cls.__name__)
+        self = cls.__new__(cls)
+        self.gpt_key = gpt_key
+        self.gpt_client = get_client(gpt_client, gpt_key)
+        self.__dict__.update(attrs)
+        self._dict = dict(zip(columns["keys"], columns["values"]))
+        return self
+
     def _get_next_item(self, asking_key):
         items = []
         last_num = -1
@@ -239,7 +310,7 @@ class InfiniteAIDict(MutableMapping):
 {items}
 {last_num + 2}. {asking_key}:
 """.strip()
-        response = gpt_client.create_completion(
+        response = self.gpt_client.create_completion(
             engine=self.gpt_engine,
             prompt=prompt,
             temperature=0.5,
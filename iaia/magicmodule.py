@@ -1,7 +1,7 @@
 import sys
 from .findimports import find_imports
 import subprocess
-from .gptclient import gpt_client
+from .gptclient import get_client
 import re
 import traceback
 
@@ -12,8 +12,9 @@ package_names_for_module = {
 
 
 class MagicModule:
-    def __init__(self, gpt_engine="text-davinci-003"):
+    def __init__(self, gpt_engine="text-davinci-003", gpt_client=None, gpt_key=None):
         self.gpt_engine = gpt_engine
+        self.gpt_client = get_client(gpt_client, gpt_key)
         # FIXME: all code appears to be in <string> and can't
         # be shown in tracebacks. Setting __file__ here doesn't
         # help, but sure what the answer is
@@ -87,7 +88,7 @@ Create a function named `{self.name}`:
         return prompt, source
 
     def get_completion(self, prompt, signature):
-        response = gpt_client.create_completion(
+        response = self.module.gpt_client.create_completion(
             engine=self.module.gpt_engine,
             prompt=prompt,
             max_tokens=1000,
@@ -156,7 +157,7 @@ At the line `{line.strip()}`
 The same function but with the {exc.__class__.__name__} exception fixed:
 
 ```"""
-        response = gpt_client.create_completion(
+        response = self.module.gpt_client.create_completion(
             engine=self.module.gpt_engine,
             prompt=prompt,
             max_tokens=1000,
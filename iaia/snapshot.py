@@ -0,0 +1,157 @@
+"""Save and load the state of InfiniteAIArray / InfiniteAIDict.
+
+The file is a small pickled header followed by one column per list of
+values. Columns of ints or floats are stored as raw 8-byte values and
+columns of strings as an offset table plus UTF-8 data, all 8-byte aligned,
+so they are read straight out of a memory map. Anything else is pickled.
+
+The header and any pickled columns are unpickled on load, so only load
+snapshots from sources you trust.
+"""
+from array import array
+import mmap
+import os
+import pickle
+import struct
+import sys
+from .fileutil import atomic_write
+
+MAGIC = b"IAIASNAP"
+VERSION = 1
+_header_struct = struct.Struct("<BQ")
+_align = 8
+
+
+class SnapshotError(Exception):
+    pass
+
+
+def save_state(path, kind, attrs, columns):
+    """Write `attrs` (a dict of picklable values) and `columns` (a dict of
+    name to list) to `path`."""
+    chunks = []
+    descriptors = {}
+    offset = 0
+    for name, values in columns.items():
+        encoding, parts = _encode_column(values)
+        start = offset
+        for part in parts:
+            chunks.append(part)
+            offset += len(part)
+        descriptors[name] = (encoding, len(values), start, offset - start)
+    header = pickle.dumps(
+        {"kind": kind, "attrs": attrs, "columns": descriptors},
+        protocol=pickle.HIGHEST_PROTOCOL,
+    )
+    header += _padding(len(MAGIC) + _header_struct.size + len(header))
+    # Written to a temporary file first so a failed save can't clobber the
+    # previous snapshot:
+    with atomic_write(path) as fp:
+        fp.write(MAGIC)
+        fp.write(_header_struct.pack(VERSION, len(header)))
+        fp.write(header)
+        for chunk in chunks:
+            fp.write(chunk)
+
+
+def load_state(path, kind):
+    """Read a file written by `save_state`, returning (attrs, columns)."""
+    with open(path, "rb") as fp:
+        if os.fstat(fp.fileno()).st_size == 0:
+            raise SnapshotError("Snapshot file is empty")
+        with mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            view = memoryview(mm)
+            try:
+                return _load(view, kind)
+            finally:
+                view.release()
+
+
+def _load(view, kind):
+    prefix = len(MAGIC) + _header_struct.size
+    if len(view) < prefix or bytes(view[: len(MAGIC)]) != MAGIC:
+        raise SnapshotError("Not an iaia snapshot file")
+    version, header_length = _header_struct.unpack(view[len(MAGIC) : prefix])
+    if version != VERSION:
+        raise SnapshotError(f"Unsupported snapshot version {version}")
+    if prefix + header_length > len(view):
+        raise SnapshotError("Snapshot file is truncated")
+    header = pickle.loads(view[prefix : prefix + header_length])
+    if header["kind"] != kind:
+        raise SnapshotError(f"Snapshot contains an {header['kind']}, not an {kind}")
+    data_start = prefix + header_length
+    columns = {}
+    for name, (encoding, count, start, length) in header["columns"].items():
+        if data_start + start + length > len(view):
+            raise SnapshotError("Snapshot file is truncated")
+        # Released right away so an error can't leave the mmap exported:
+        with view[data_start + start : data_start + start + length] as data:
+            values = _decode_column(encoding, count, data)
+        if len(values) != count:
+            raise SnapshotError(f"Snapshot column {name} has the wrong length")
+        columns[name] = values
+    return header["attrs"], columns
+
+
+def _encode_column(values):
+    if values and all(type(v) is int for v in values):
+        try:
+            return "int64", [_to_bytes(array("q", values))]
+        except OverflowError:
+            pass
+    elif values and all(type(v) is float for v in values):
+        return "float64", [_to_bytes(array("d", values))]
+    elif values and all(type(v) is str for v in values):
+        encoded = [v.encode("utf8") for v in values]
+        offsets = array("q", [0])
+        for item in encoded:
+            offsets.append(offsets[-1] + len(item))
+        data = b"".join(encoded)
+        return "str", [_to_bytes(offsets), data, _padding(len(data))]
+    data = pickle.dumps(list(values), protocol=pickle.HIGHEST_PROTOCOL)
+    return "pickle", [data, _padding(len(data))]
+
+
+def _decode_column(encoding, count, data):
+    if encoding == "int64":
+        return _from_bytes("q", data, count).tolist()
+    if encoding == "float64":
+        return _from_bytes("d", data, count).tolist()
+    if encoding == "str":
+        offsets = _from_bytes("q", data, count + 1)
+        base = offsets.itemsize * (count + 1)
+        if base + offsets[-1] > len(data):
+            raise SnapshotError("Snapshot string column is truncated")
+        text = bytes(data[base : base + offsets[-1]]).decode("utf8")
+        if text.isascii():
+            # Byte offsets are character offsets, so slice the str directly:
+            return [text[offsets[i] : offsets[i + 1]] for i in range(count)]
+        return [
+            bytes(data[base + offsets[i] : base + offsets[i + 1]]).decode("utf8")
+            for i in range(count)
+        ]
+    if encoding == "pickle":
+        return pickle.loads(data)
+    raise SnapshotError(f"Unknown column encoding {encoding!r}")
+
+
+def _to_bytes(arr):
+    # The file is always little-endian:
+    if sys.byteorder != "little":
+        arr = array(arr.typecode, arr)
+        arr.byteswap()
+    return arr.tobytes()
+
+
+def _from_bytes(typecode, data, count):
+    arr = array(typecode)
+    if arr.itemsize * count > len(data):
+        raise SnapshotError("Snapshot column is truncated")
+    arr.frombytes(data[: arr.itemsize * count])
+    if sys.byteorder != "little":
+        arr.byteswap()
+    return arr
+
+
+def _padding(length):
+    return b"\0" * (-length % _align)
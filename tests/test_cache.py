@@ -0,0 +1,200 @@
+import socket
+import stat
+import threading
+import openai
+import pytest
+from openai.openai_object import OpenAIObject
+from iaia import fileutil
+from iaia.cache import CacheError, DirectoryCache, ServerCache
+from iaia.cacheserver import CacheServer
+from iaia.gptclient import GptClient
+
+
+def start_server(address=("127.0.0.1", 0), cache_dir=None):
+    server = CacheServer(address, cache_dir=cache_dir)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def stop_server(server):
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def server():
+    server = start_server()
+    yield server
+    stop_server(server)
+
+
+@pytest.fixture
+def cache(server):
+    cache = ServerCache(server.server_address, secret="test-secret")
+    yield cache
+    cache.close()
+
+
+def test_directory_cache(tmp_path):
+    cache = DirectoryCache(tmp_path / "cache")
+    assert cache.get("missing") is None
+    cache.set("key", b"value")
+    cache.set("key", b"new value")
+    assert cache.get("key") == b"new value"
+    assert not list((tmp_path / "cache").glob(".tmp-*"))
+
+
+def test_server_miss_and_hit(cache):
+    assert cache.get("missing") is None
+    cache.set("key", b"line\none\nline two")
+    assert cache.get("key") == b"line\none\nline two"
+    cache.set("empty", b"")
+    assert cache.get("empty") == b""
+    big = bytes(range(256)) * 10000
+    cache.set("big", big)
+    assert cache.get("big") == big
+
+
+def test_connections_are_reused(cache):
+    cache.set("key", b"value")
+    cache.get("key")
+    cache.get("key")
+    assert len(cache._pool) == 1
+
+
+def test_stale_connection_retry(tmp_path):
+    server = start_server(cache_dir=tmp_path)
+    address = server.server_address
+    cache = ServerCache(address, secret="test-secret")
+    cache.set("key", b"value")
+    assert len(cache._pool) == 1
+    stop_server(server)
+    # The pooled connection now points at a server that's gone:
+    server = start_server(address, cache_dir=tmp_path)
+    try:
+        assert cache.get("key") == b"value"
+    finally:
+        cache.close()
+        stop_server(server)
+
+
+def test_secret_required(server, monkeypatch):
+    monkeypatch.delenv("IAIA_CACHE_SECRET", raising=False)
+    with pytest.raises(CacheError):
+        ServerCache(server.server_address)
+    monkeypatch.setenv("IAIA_CACHE_SECRET", "from-env")
+    assert ServerCache(server.server_address).secret == b"from-env"
+
+
+def test_unsigned_entries_rejected(server, cache):
+    payload = b"not signed by us" * 4
+    with socket.create_connection(server.server_address) as sock:
+        fp = sock.makefile("rwb")
+        fp.write(f"SET key {len(payload)}\n".encode("utf8") + payload)
+        fp.flush()
+        assert fp.readline() == b"OK\n"
+    with pytest.raises(CacheError):
+        cache.get("key")
+    other = ServerCache(server.server_address, secret="other-secret")
+    other.set("key2", b"value")
+    with pytest.raises(CacheError):
+        cache.get("key2")
+    other.close()
+
+
+@pytest.mark.parametrize(
+    "request_line",
+    [
+        b"GET ../../etc/passwd\n",
+        "SET key \u00b2\n".encode("utf8"),
+        b"SET key -1\n",
+        b"DELETE key\n",
+    ],
+)
+def test_bad_request(server, request_line):
+    with socket.create_connection(server.server_address) as sock:
+        fp = sock.makefile("rwb")
+        fp.write(request_line)
+        fp.flush()
+        assert fp.readline() == b"ERROR bad request\n"
+
+
+def fake_response(text="response"):
+    return OpenAIObject.construct_from(
+        {
+            "usage": {"total_tokens": 3, "prompt_tokens": 1, "completion_tokens": 2},
+            "choices": [{"text": text, "finish_reason": "stop"}],
+        }
+    )
+
+
+def test_client_without_cache_server(monkeypatch):
+    calls = []
+
+    def create(**kw):
+        calls.append(kw)
+        return fake_response()
+
+    monkeypatch.setattr(openai.Completion, "create", create)
+    # Nothing listens on port 1:
+    client = GptClient(cache=ServerCache(("127.0.0.1", 1), secret="test-secret"))
+    response = client.create_completion("prompt")
+    assert response.choices[0].text == "response"
+    assert len(calls) == 1
+
+
+def test_client_uses_cache(cache, monkeypatch):
+    calls = []
+
+    def create(**kw):
+        calls.append(kw)
+        return fake_response()
+
+    monkeypatch.setattr(openai.Completion, "create", create)
+    client = GptClient(cache=cache)
+    client.create_completion("prompt")
+    response = client.create_completion("prompt")
+    assert response.choices[0].text == "response"
+    assert len(calls) == 1
+
+
+def test_server_directory_is_separate_from_local_cache(tmp_path):
+    server = start_server(cache_dir=tmp_path)
+    cache = ServerCache(server.server_address, secret="test-secret")
+    try:
+        cache.set("key", b"signed value")
+        local = DirectoryCache(tmp_path)
+        assert local.get("key") is None
+        local.set("key", b"local value")
+        assert cache.get("key") == b"signed value"
+    finally:
+        cache.close()
+        stop_server(server)
+
+
+@pytest.mark.parametrize("entry", [b"", b"garbage", b"\x80\x05\x95truncated"])
+def test_client_ignores_corrupt_entry(tmp_path, monkeypatch, entry):
+    monkeypatch.setattr(openai.Completion, "create", lambda **kw: fake_response())
+    client = GptClient(cache=DirectoryCache(tmp_path))
+    client.create_completion("prompt")
+    (filename,) = tmp_path.glob("*.pickle")
+    filename.write_bytes(entry)
+    response = client.create_completion("prompt")
+    assert response.choices[0].text == "response"
+
+
+def test_cache_server_without_secret_falls_back(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("IAIA_CACHE_SERVER", "127.0.0.1:8765")
+    monkeypatch.delenv("IAIA_CACHE_SECRET", raising=False)
+    with pytest.warns(UserWarning):
+        client = GptClient()
+    assert isinstance(client.cache, DirectoryCache)
+    assert client.cache.cache_dir == tmp_path / "iaia-cache"
+
+
+def test_directory_cache_permissions(tmp_path, monkeypatch):
+    monkeypatch.setattr(fileutil, "_umask", 0o022)
+    cache = DirectoryCache(tmp_path)
+    cache.set("key", b"value")
+    assert stat.S_IMODE(cache.filename("key").stat().st_mode) == 0o644
@@ -0,0 +1,130 @@
+import openai
+import pytest
+from openai.openai_object import OpenAIObject
+import iaia
+from iaia import InfiniteAIArray, MagicModule, gptclient
+from iaia.cache import DirectoryCache
+from iaia.gptclient import GptClient, RoutingGptClient, get_client
+
+
+def fake_response(text):
+    return OpenAIObject.construct_from(
+        {
+            "usage": {"total_tokens": 3, "prompt_tokens": 1, "completion_tokens": 2},
+            "choices": [{"text": text, "finish_reason": "stop"}],
+        }
+    )
+
+
+@pytest.fixture
+def api(tmp_path, monkeypatch):
+    """Fakes the OpenAI API; set `api.errors[key]` to make a key fail."""
+
+    class FakeApi:
+        calls = []
+        errors = {}
+
+        @classmethod
+        def create(cls, **kw):
+            key = kw.get("api_key")
+            cls.calls.append((key, kw["engine"]))
+            if key in cls.errors:
+                raise cls.errors[key]
+            return fake_response(f" {key}")
+
+    monkeypatch.setattr(openai.Completion, "create", FakeApi.create)
+    monkeypatch.setattr(gptclient.gpt_client, "cache", DirectoryCache(tmp_path))
+    monkeypatch.setattr(gptclient.gpt_client, "verbose", False)
+    monkeypatch.setattr(gptclient, "_key_clients", {})
+    return FakeApi
+
+
+def test_failover_and_cooldown(api):
+    api.errors["bad"] = openai.error.RateLimitError("slow down")
+    router = RoutingGptClient([("bad", 1000), ("good", 1)])
+    router._random.seed(0)
+    for i in range(3):
+        response = router.create_completion(f"prompt {i}")
+        assert response.choices[0].text == " good"
+    assert [key for key, engine in api.calls] == ["bad", "good", "good", "good"]
+    bad, good = router.routes
+    assert bad.failures == 1 and bad.failed_until > 0
+    assert good.failures == 0 and good.failed_until == 0
+
+
+def test_request_errors_do_not_fail_over(api):
+    api.errors["a"] = api.errors["b"] = openai.error.InvalidRequestError(
+        "context too long", None
+    )
+    router = RoutingGptClient(["a", "b"])
+    with pytest.raises(openai.error.InvalidRequestError):
+        router.create_completion("prompt")
+    assert len(api.calls) == 1
+    assert all(route.failed_until == 0 for route in router.routes)
+
+
+def test_all_routes_fail(api):
+    api.errors["a"] = openai.error.ServiceUnavailableError("down")
+    api.errors["b"] = openai.error.AuthenticationError("bad key")
+    router = RoutingGptClient(["a", "b"])
+    with pytest.raises(
+        (openai.error.ServiceUnavailableError, openai.error.AuthenticationError)
+    ):
+        router.create_completion("prompt")
+    assert sorted(key for key, engine in api.calls) == ["a", "b"]
+
+
+def test_weights_and_engine(api):
+    router = RoutingGptClient([("never", 0), ("always", 1, "other-engine")])
+    for i in range(5):
+        router.create_completion(f"prompt {i}", engine="text-davinci-003")
+    assert set(api.calls) == {("always", "other-engine")}
+
+
+def test_one_client_per_key(api):
+    a = InfiniteAIArray([1, 2], gpt_key="sk-1")
+    b = InfiniteAIArray([1, 2], gpt_key="sk-1")
+    router = RoutingGptClient(["sk-1"])
+    assert a.gpt_client is b.gpt_client is router.routes[0].client
+    assert a.gpt_client.key == "sk-1"
+    assert get_client(key="sk-2") is not a.gpt_client
+    assert get_client() is gptclient.gpt_client
+
+
+def test_settings_apply_to_key_clients(api, tmp_path):
+    client = get_client(key="sk-1")
+    router = RoutingGptClient(["sk-2"])
+    iaia.set_verbose(True)
+    assert client.verbose and router.verbose
+    iaia.set_cache_server(None)
+    assert client.cache is gptclient.gpt_client.cache
+    assert router.routes[0].client.cache is gptclient.gpt_client.cache
+
+
+def test_containers_use_their_client(api, tmp_path):
+    client = GptClient(cache=DirectoryCache(tmp_path), key="mine")
+    names = InfiniteAIArray(["a", "b"], gpt_client=client)
+    assert names[2] == "mine"
+    assert api.calls == [("mine", "text-davinci-003")]
+    assert MagicModule(gpt_client=client).gpt_client is client
+
+
+def test_zero_weight_never_used_for_failover(api):
+    api.errors["busy"] = openai.error.RateLimitError("slow down")
+    router = RoutingGptClient([("busy", 1), ("never", 0)])
+    for i in range(3):
+        with pytest.raises(openai.error.RateLimitError):
+            router.create_completion(f"prompt {i}")
+    assert {key for key, engine in api.calls} == {"busy"}
+
+
+def test_rate_limited_route_waits_for_window(api, tmp_path):
+    limited = GptClient(cache=DirectoryCache(tmp_path), key="limited")
+    limited.rate_limit = 2
+    router = RoutingGptClient([(limited, 1000), ("other", 1)], cooldown=1)
+    router._random.seed(0)
+    for i in range(3):
+        router.create_completion(f"prompt {i}")
+    route = router.routes[0]
+    assert route.failures == 1
+    assert route.failed_until == pytest.approx(limited._last_times[0] + 60)
@@ -0,0 +1,142 @@
+import pickle
+import pytest
+from iaia import InfiniteAIArray, InfiniteAIDict, snapshot
+from iaia.snapshot import (
+    MAGIC,
+    SnapshotError,
+    _encode_column,
+    _header_struct,
+    load_state,
+    save_state,
+)
+
+
+def roundtrip(tmp_path, values):
+    path = tmp_path / "columns.iaia"
+    save_state(path, "test", {"a": 1}, {"values": values})
+    attrs, columns = load_state(path, "test")
+    assert attrs == {"a": 1}
+    return columns["values"]
+
+
+@pytest.mark.parametrize(
+    "values",
+    [
+        [],
+        [1, -2, 3],
+        [1.5, -2.25, 1e300],
+        ["a", "", "b c"],
+        ["héllo", "日本", "", "plain"],
+        [1, 2.5, "three", None],
+        [1, 2**70],
+    ],
+)
+def test_column_roundtrip(tmp_path, values):
+    result = roundtrip(tmp_path, values)
+    assert result == values
+    assert [type(v) for v in result] == [type(v) for v in values]
+
+
+def test_column_encodings():
+    assert _encode_column([1, 2])[0] == "int64"
+    assert _encode_column([1.0, 2.0])[0] == "float64"
+    assert _encode_column(["a"])[0] == "str"
+    assert _encode_column([1, 2**70])[0] == "pickle"
+    assert _encode_column([1, 2.0])[0] == "pickle"
+    assert _encode_column([True, 1])[0] == "pickle"
+
+
+def test_columns_are_aligned(tmp_path):
+    path = tmp_path / "columns.iaia"
+    save_state(
+        path, "test", {}, {"a": ["odd", "lengths"], "b": [1, 2, 3], "c": [None]}
+    )
+    data = path.read_bytes()
+    prefix = len(MAGIC) + _header_struct.size
+    _, header_length = _header_struct.unpack(data[len(MAGIC) : prefix])
+    assert (prefix + header_length) % 8 == 0
+    header = pickle.loads(data[prefix : prefix + header_length])
+    for encoding, count, start, length in header["columns"].values():
+        assert start % 8 == 0
+        assert length % 8 == 0
+    assert len(data) % 8 == 0
+
+
+def test_array_save_load(tmp_path):
+    path = tmp_path / "array.iaia"
+    names = InfiniteAIArray(["Bingo", "Spot", "Fido"], gpt_key="sk-secret")
+    names._waiting_items = ["Rover", "Daisy"]
+    names.max_gpt_context = 3
+    names.save(path)
+    assert b"sk-secret" not in path.read_bytes()
+    loaded = InfiniteAIArray.load(path)
+    assert loaded._list == ["Bingo", "Spot", "Fido"]
+    assert loaded._waiting_items == ["Rover", "Daisy"]
+    assert loaded._type == "str"
+    assert loaded._prompt_context == names._prompt_context
+    assert loaded.max_gpt_context == 3
+    assert loaded.gpt_key is None
+    assert loaded[:5] == ["Bingo", "Spot", "Fido", "Rover", "Daisy"]
+
+
+def test_dict_save_load(tmp_path):
+    path = tmp_path / "dict.iaia"
+    populations = InfiniteAIDict({"Tokyo": 9273000, "London": 8900000})
+    populations.save(path)
+    loaded = InfiniteAIDict.load(path)
+    assert loaded._dict == {"Tokyo": 9273000, "London": 8900000}
+    assert loaded._type == "number"
+    assert loaded.rate_limit == populations.rate_limit
+
+
+def test_kind_mismatch(tmp_path):
+    path = tmp_path / "dict.iaia"
+    InfiniteAIDict({"a": "b"}).save(path)
+    with pytest.raises(SnapshotError):
+        InfiniteAIArray.load(path)
+
+
+def test_version_mismatch(tmp_path):
+    path = tmp_path / "array.iaia"
+    InfiniteAIArray([1, 2, 3]).save(path)
+    data = bytearray(path.read_bytes())
+    data[len(MAGIC)] = 99
+    path.write_bytes(bytes(data))
+    with pytest.raises(SnapshotError):
+        InfiniteAIArray.load(path)
+
+
+def test_not_a_snapshot(tmp_path):
+    path = tmp_path / "other.iaia"
+    path.write_bytes(b"something else entirely")
+    with pytest.raises(SnapshotError):
+        InfiniteAIArray.load(path)
+
+
+def test_empty_file(tmp_path):
+    path = tmp_path / "empty.iaia"
+    path.write_bytes(b"")
+    with pytest.raises(SnapshotError):
+        InfiniteAIArray.load(path)
+
+
+@pytest.mark.parametrize("cut", [8, 16, 100])
+def test_truncated_file(tmp_path, cut):
+    path = tmp_path / "dict.iaia"
+    InfiniteAIDict({f"key {i}": i for i in range(20)}).save(path)
+    data = path.read_bytes()
+    path.write_bytes(data[:-cut])
+    with pytest.raises(SnapshotError):
+        InfiniteAIDict.load(path)
+
+
+def test_failed_save_keeps_old_snapshot(tmp_path, monkeypatch):
+    path = tmp_path / "array.iaia"
+    InfiniteAIArray([1, 2, 3]).save(path)
+    before = path.read_bytes()
+    # A str can't be written to a binary file, so the save fails partway:
+    monkeypatch.setattr(snapshot, "MAGIC", "IAIASNAP")
+    with pytest.raises(TypeError):
+        InfiniteAIArray([4, 5, 6]).save(path)
+    assert path.read_bytes() == before
+    assert list(tmp_path.iterdir()) == [path]